@@ -27,6 +27,7 @@ import {
 } from './steals.js';
 
 import {
+    expandCompactEtymology,
     formatEtymology,
     formatEtymologySimple,
     getSharedEtymologies
@@ -72,7 +73,7 @@ async function loadDictionary() {
 
         // Load etymology if available
         if (etymResponse && etymResponse.ok) {
-            setEtymology(await etymResponse.json());
+            setEtymology(expandCompactEtymology(await etymResponse.json()));
             console.log(`Etymology loaded: ${Object.keys(getEtymology()).length} entries`);
         } else {
             console.log('Etymology not available, using affix-based detection only');
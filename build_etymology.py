@@ -9,16 +9,39 @@ Usage:
 2. Run this script:
    python build_etymology.py enwiktionary-latest-pages-articles.xml.bz2
 
-3. Output will be etymology.json
+3. Output will be etymology.json, already expanded to derived terms and
+   inflected forms (no need to run expand_etymology.py/expand_inflections.py),
+   plus etymology.compact.json for the game. The derived terms map found on
+   the way is also saved to derived_terms.pkl, so a later expand_etymology.py
+   run against the same dump can skip re-parsing it.
 """
 
-import bz2
-import json
 import re
 import sys
 from collections import defaultdict
 from pathlib import Path
 
+from etymology_common import (
+    english_section,
+    iter_page_batches,
+    iter_subsections,
+    iter_wiktionary_pages,
+    load_scrabble_dictionary,
+    map_page_batches,
+    parse_workers,
+    save_compact_etymology,
+    save_etymology,
+    scrabble_title_filter,
+    worker_scrabble_words,
+)
+from expand_etymology import (
+    derived_cache_key,
+    expand_etymology,
+    extract_derived_terms,
+    save_derived_terms_cache,
+)
+from expand_inflections import expand_inflections
+
 # Language codes we care about (stopping points for etymology - not going to PIE)
 ROOT_LANGUAGES = {
     'la': 'latin',
@@ -48,16 +71,16 @@ ROOT_LANGUAGES = {
 # Skip these - too far back or not useful
 SKIP_LANGUAGES = {'ine-pro', 'ine-bsl-pro', 'gem-pro'}
 
-
-def load_scrabble_dictionary(url="https://raw.githubusercontent.com/redbo/scrabble/master/dictionary.txt"):
-    """Load the Scrabble dictionary to filter results."""
-    import urllib.request
-    print(f"Loading Scrabble dictionary from {url}...")
-    with urllib.request.urlopen(url) as response:
-        text = response.read().decode('utf-8')
-    words = set(word.strip().upper() for word in text.split('\n') if word.strip())
-    print(f"Loaded {len(words)} Scrabble words")
-    return words
+# Precompiled patterns (these run once per page of the dump)
+_ETYM_HEADING_RE = re.compile(r'===Etymology(?:\s*\d*)?===')
+# Patterns: {{der|en|la|word}}, {{inh|en|la|word}}, {{bor|en|la|word}}
+# Also handles {{bor+|...}}, {{der+|...}}, {{inh+|...}} variants
+_ETYM_TMPL_RE = re.compile(
+    r'\{\{(?:der|inh|bor|borrowed|derived|inherited)\+?\|en\|([a-z-]+)\|([^|}]+)',
+    re.IGNORECASE
+)
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_WIKILINK_RE = re.compile(r'\[\[([^\]|]+)(\|[^\]]+)?\]\]')
 
 
 def extract_etymology_from_text(wiki_text):
@@ -67,41 +90,27 @@ def extract_etymology_from_text(wiki_text):
     Handles multiple etymology sections (Etymology 1, Etymology 2, etc.)
     """
     # Only process if it has an English section
-    if '==English==' not in wiki_text:
+    section = english_section(wiki_text)
+    if section is None:
         return None
 
-    # Extract the English section
-    english_match = re.search(r'==English==(.*?)(?=\n==[^=]|\Z)', wiki_text, re.DOTALL)
-    if not english_match:
-        return None
-
-    english_section = english_match.group(1)
-
     # Find ALL etymology sections within English (Etymology, Etymology 1, Etymology 2, etc.)
-    etym_sections = re.findall(
-        r'===Etymology(?:\s*\d*)?===(.*?)(?=\n===|\Z)',
-        english_section,
-        re.DOTALL
-    )
+    etym_sections = list(iter_subsections(section, _ETYM_HEADING_RE))
 
     if not etym_sections:
         return None
 
     # Extract etymology templates from ALL sections
-    # Patterns: {{der|en|la|word}}, {{inh|en|la|word}}, {{bor|en|la|word}}
-    # Also handles {{bor+|...}}, {{der+|...}}, {{inh+|...}} variants
-    pattern = r'\{\{(?:der|inh|bor|borrowed|derived|inherited)\+?\|en\|([a-z-]+)\|([^|}]+)'
-
     all_etymologies = set()  # Use set to dedupe
 
     for etymology_text in etym_sections:
-        for match in re.finditer(pattern, etymology_text, re.IGNORECASE):
+        for match in _ETYM_TMPL_RE.finditer(etymology_text):
             lang_code = match.group(1).lower()
             word = match.group(2).strip()
 
             # Clean up the word
-            word = re.sub(r'<[^>]+>', '', word)  # Remove HTML
-            word = re.sub(r'\[\[([^\]|]+)(\|[^\]]+)?\]\]', r'\1', word)  # [[word|display]] -> word
+            word = _HTML_TAG_RE.sub('', word)  # Remove HTML
+            word = _WIKILINK_RE.sub(r'\1', word)  # [[word|display]] -> word
             word = word.split('|')[0].strip()
             word = word.strip('*')  # Remove reconstructed word marker
 
@@ -120,101 +129,69 @@ def extract_etymology_from_text(wiki_text):
     return list(all_etymologies)
 
 
-def iter_wiktionary_pages(filepath):
+def process_page(title, text, scrabble_words):
     """
-    Iterator that yields (title, text) tuples from Wiktionary XML dump.
-    Uses simple regex parsing instead of XML parser for reliability.
+    Run every per-page extraction on one page, so the dump is read only once.
+    Returns a dict with the page's 'etymology' (list or None) and its
+    'derived' Scrabble-word terms.
     """
-    filepath = Path(filepath)
-
-    if filepath.suffix == '.bz2':
-        open_func = lambda p: bz2.open(p, 'rt', encoding='utf-8')
-    else:
-        open_func = lambda p: open(p, 'r', encoding='utf-8')
-
-    print(f"Parsing {filepath}...")
-
-    with open_func(filepath) as f:
-        current_title = None
-        current_text = []
-        in_text = False
-        page_count = 0
-
-        for line in f:
-            # Look for title
-            title_match = re.search(r'<title>([^<]+)</title>', line)
-            if title_match:
-                current_title = title_match.group(1)
-                continue
+    word_upper = title.upper()
 
-            # Look for text start
-            text_start = re.search(r'<text[^>]*>(.*)', line)
-            if text_start:
-                in_text = True
-                content = text_start.group(1)
-                # Check if text ends on same line
-                if '</text>' in content:
-                    content = content.split('</text>')[0]
-                    in_text = False
-                    if current_title and ':' not in current_title:
-                        yield current_title, content
-                        page_count += 1
-                        if page_count % 50000 == 0:
-                            print(f"  Processed {page_count} pages...")
-                else:
-                    current_text = [content]
-                continue
+    # Skip etymology for proper nouns (titles starting with capital letter)
+    # These are names, German nouns, etc. - not valid Scrabble words
+    etymology = None if title[0].isupper() else extract_etymology_from_text(text)
+
+    derived = [d for d in extract_derived_terms(text, title)
+               if d in scrabble_words and d != word_upper]
 
-            # In text block
-            if in_text:
-                if '</text>' in line:
-                    current_text.append(line.split('</text>')[0])
-                    in_text = False
-                    if current_title and ':' not in current_title:
-                        yield current_title, '\n'.join(current_text)
-                        page_count += 1
-                        if page_count % 50000 == 0:
-                            print(f"  Processed {page_count} pages...")
-                    current_text = []
-                else:
-                    current_text.append(line)
+    return {'etymology': etymology, 'derived': derived}
 
-    print(f"  Total pages processed: {page_count}")
+
+def _process_batch(pages):
+    """
+    Worker: run process_page over a batch of (already filtered) pages.
+    Returns a list of (title, process_page result) tuples.
+    """
+    scrabble_words = worker_scrabble_words()
+    return [(title, process_page(title, text, scrabble_words))
+            for title, text in pages]
 
 
-def build_etymology_dict(wiktionary_path, scrabble_words):
+def scan_wiktionary(wiktionary_path, scrabble_words):
     """
-    Build etymology dictionary from Wiktionary dump.
+    Build the etymology dictionary and the derived terms map from a single
+    pass over the Wiktionary dump.
+    Returns (etymology_dict, derived_map).
     """
     etymology_dict = {}
+    derived_map = defaultdict(set)
     found = 0
     checked = 0
 
-    for title, text in iter_wiktionary_pages(wiktionary_path):
-        # Skip proper nouns (titles starting with capital letter)
-        # These are names, German nouns, etc. - not valid Scrabble words
-        if title[0].isupper():
-            continue
-
-        word_upper = title.upper()
-
-        # Only process words in Scrabble dictionary
-        if word_upper not in scrabble_words:
-            continue
+    # Only parse words in the Scrabble dictionary
+    pages = iter_wiktionary_pages(wiktionary_path, title_filter=scrabble_title_filter(scrabble_words))
+    for results in map_page_batches(_process_batch, iter_page_batches(pages), scrabble_words,
+                                    max_workers=parse_workers(wiktionary_path)):
+        for title, page in results:
+            # Proper nouns only contribute derived terms (see process_page)
+            if not title[0].isupper():
+                checked += 1
+                if checked % 5000 == 0:
+                    print(f"  Checked {checked} Scrabble words, found etymology for {found}...")
 
-        checked += 1
-        if checked % 5000 == 0:
-            print(f"  Checked {checked} Scrabble words, found etymology for {found}...")
+            # Intern so keys share storage with scrabble_words and derived_map
+            word_upper = sys.intern(title.upper())
 
-        # Parse etymology
-        root = extract_etymology_from_text(text)
+            if page['etymology']:
+                etymology_dict[word_upper] = page['etymology']
+                found += 1
 
-        if root:
-            etymology_dict[word_upper] = root
-            found += 1
+            if page['derived']:
+                derived_map[word_upper].update(map(sys.intern, page['derived']))
 
     print(f"\nFound etymology for {found} out of {len(scrabble_words)} Scrabble words ({100*found/len(scrabble_words):.1f}%)")
-    return etymology_dict
+    print(f"Found {len(derived_map)} words with derived terms")
+    return etymology_dict, derived_map
 
 
 def main():
@@ -233,15 +210,30 @@ def main():
     # Load Scrabble dictionary
     scrabble_words = load_scrabble_dictionary()
 
-    # Build etymology dictionary
-    etymology_dict = build_etymology_dict(wiktionary_path, scrabble_words)
+    # Single pass over the dump: etymologies and derived terms together
+    print("\n=== Scanning Wiktionary ===")
+    etymology_dict, derived_map = scan_wiktionary(wiktionary_path, scrabble_words)
+
+    # Lets expand_etymology.py rerun against this dump without re-parsing it
+    save_derived_terms_cache(derived_map, derived_cache_key(wiktionary_path, scrabble_words))
+
+    # The remaining passes run over in-memory dicts, not the dump
+    print("\n=== Propagating etymologies to derived terms ===")
+    etymology_dict = expand_etymology(etymology_dict, derived_map, scrabble_words)
+
+    print("\n=== Propagating to inflected forms ===")
+    etymology_dict = expand_inflections(etymology_dict, scrabble_words)
 
     # Save to JSON
     output_path = Path(__file__).parent / 'etymology.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(etymology_dict, f, indent=2, sort_keys=True)
+    save_etymology(etymology_dict, output_path)
+
+    # Compact copy the game loads (see save_compact_etymology)
+    compact_path = Path(__file__).parent / 'etymology.compact.json'
+    save_compact_etymology(etymology_dict, compact_path)
 
     print(f"\nSaved etymology dictionary to {output_path}")
+    print(f"Saved game copy to {compact_path}")
     print(f"Total entries: {len(etymology_dict)}")
 
     # Print some stats
@@ -266,7 +258,7 @@ def main():
         examples = ['FIX', 'AFFIX', 'SUFFIX', 'PREFIX', 'BANG', 'BANGLE', 'WIND', 'WINDY']
         for word in examples:
             if word in etymology_dict:
-                f.write(f"  {word}: {etymology_dict[word]}\n")
+                f.write(f"  {word}: {list(etymology_dict[word])}\n")
     print("\nSample entries written to etymology_samples.txt")
 
 
@@ -3,6 +3,16 @@
 
 import { getEtymology } from './state.js';
 
+// Expand the compact etymology file (written by the Python build scripts) into
+// a word -> etymology list map. Words sharing an etymology share one array.
+export function expandCompactEtymology({ words, etymologies, index }) {
+    const etymology = {};
+    words.split('\n').forEach((word, i) => {
+        etymology[word] = etymologies[index[i]];
+    });
+    return etymology;
+}
+
 // Format a single etymology entry as HTML
 function formatEtymologyEntry(entry) {
     const [lang, root] = entry.split(':');
@@ -0,0 +1,320 @@
+"""
+Helpers shared by build_etymology.py, expand_etymology.py and
+expand_inflections.py: the Scrabble dictionary, etymology.json I/O,
+wiki markup sections, and streaming the Wiktionary dump through a
+process pool.
+"""
+
+import bz2
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+SCRABBLE_URL = "https://raw.githubusercontent.com/redbo/scrabble/master/dictionary.txt"
+
+# Downloaded dictionaries are cached here, one file per URL, so reruns
+# don't re-fetch them; delete a file to force a fresh download
+SCRABBLE_CACHE_DIR = Path.home() / '.cache' / 'snatch'
+
+# Read buffer for streaming the (multi-GB) dump
+DUMP_BUFFER_SIZE = 1 << 20
+
+# Pages per worker task - large enough to amortize pickling overhead
+BATCH_SIZE = 200
+
+# Precompiled patterns (these run once per page of the dump)
+_LEVEL2_HEADING_RE = re.compile(r'\n==[^=]')
+
+
+def scrabble_cache_path(url):
+    """Return the cache file for the dictionary downloaded from url."""
+    url_digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+    return SCRABBLE_CACHE_DIR / f'scrabble-{url_digest}.txt'
+
+
+def load_scrabble_dictionary(url=SCRABBLE_URL, cache_path=None):
+    """
+    Load the Scrabble dictionary to filter results.
+    Downloaded once to cache_path (by default scrabble_cache_path(url), so
+    each URL gets its own copy); later runs read the cached copy.
+    Returns a frozenset of interned words, so the strings are shared with
+    every dict built from them and the set is safe to hand to workers.
+    """
+    cache_path = Path(cache_path) if cache_path else scrabble_cache_path(url)
+    if not cache_path.exists():
+        import shutil
+        import urllib.request
+        print(f"Downloading Scrabble dictionary from {url}...")
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        with urllib.request.urlopen(url) as response, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+        tmp_path.replace(cache_path)
+
+    print(f"Loading Scrabble dictionary from {cache_path}...")
+    words = set()
+    with open(cache_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            word = line.strip().upper()
+            if word:
+                words.add(sys.intern(word))
+    print(f"Loaded {len(words)} Scrabble words")
+    return frozenset(words)
+
+
+def load_etymology(path):
+    """
+    Load an etymology JSON file.
+    Uses orjson when installed - several times faster than json on a file this size.
+    """
+    try:
+        import orjson
+    except ImportError:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return orjson.loads(Path(path).read_bytes())
+
+
+def save_compact_etymology(etymology_dict, path):
+    """
+    Save the compact copy of the etymology dictionary that the game loads:
+    the sorted words as one newline-joined string, each distinct etymology
+    list once, and a per-word index into those lists. Far smaller and faster
+    to parse than the indented etymology.json, which stays human-readable.
+    """
+    words = sorted(etymology_dict)
+    etymologies = []
+    positions = {}
+    index = []
+    for word in words:
+        etym = tuple(etymology_dict[word])
+        if etym not in positions:
+            positions[etym] = len(etymologies)
+            etymologies.append(etym)
+        index.append(positions[etym])
+
+    compact = {'words': '\n'.join(words), 'etymologies': etymologies, 'index': index}
+    try:
+        import orjson
+    except ImportError:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(compact, f, separators=(',', ':'), ensure_ascii=False)
+        return
+    Path(path).write_bytes(orjson.dumps(compact))
+
+
+def save_etymology(etymology_dict, path):
+    """
+    Save the etymology dictionary as sorted, 2-space-indented JSON.
+    Uses orjson when installed; the json fallback writes the same bytes
+    (non-ASCII stays UTF-8 rather than being escaped).
+    """
+    try:
+        import orjson
+    except ImportError:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(etymology_dict, f, indent=2, sort_keys=True, ensure_ascii=False)
+    else:
+        Path(path).write_bytes(orjson.dumps(etymology_dict, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+
+
+def english_section(wiki_text):
+    """
+    Return the text of the ==English== section, or None if there is none.
+    The section runs from its heading to the next level-2 heading, or the
+    end of the page.
+    """
+    start = wiki_text.find('==English==')
+    if start == -1:
+        return None
+    start += len('==English==')
+    end = _LEVEL2_HEADING_RE.search(wiki_text, start)
+    return wiki_text[start:end.start() if end else len(wiki_text)]
+
+
+def iter_subsections(section, heading_re):
+    """
+    Yield the body of each subsection whose heading matches heading_re.
+    A body runs up to the next heading of level 3 or deeper, or the end.
+    """
+    pos = 0
+    while True:
+        heading = heading_re.search(section, pos)
+        if not heading:
+            return
+        end = section.find('\n===', heading.end())
+        if end == -1:
+            end = len(section)
+        yield section[heading.end():end]
+        pos = end
+
+
+def keep_link_target(match):
+    """re.sub callback: keep a wikilink's target, drop anything else matched."""
+    return match.group(1) or ''
+
+
+def decoder_threads(filepath):
+    """
+    Number of threads open_dump decompresses filepath with: half the cores
+    for a bz2 dump when indexed_bzip2 is installed, else 0 (decoding, if
+    any, happens on the thread reading the dump).
+    """
+    if Path(filepath).suffix != '.bz2':
+        return 0
+    try:
+        import indexed_bzip2
+    except ImportError:
+        return 0
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def parse_workers(filepath):
+    """
+    Number of worker processes for map_page_batches while reading filepath:
+    the cores its decoder threads leave free, so the two don't oversubscribe.
+    """
+    return max(1, (os.cpu_count() or 1) - decoder_threads(filepath))
+
+
+def open_dump(filepath):
+    """
+    Open a Wiktionary dump (plain or .bz2) as a binary stream.
+    Decompression dominates parsing time, so bz2 dumps use indexed_bzip2's
+    parallel decoder (decoder_threads threads) when it is installed, else a
+    large-buffered BZ2File.
+    """
+    filepath = Path(filepath)
+
+    if filepath.suffix != '.bz2':
+        return open(filepath, 'rb', buffering=DUMP_BUFFER_SIZE)
+
+    try:
+        import indexed_bzip2
+    except ImportError:
+        return io.BufferedReader(bz2.BZ2File(filepath, 'rb'), buffer_size=DUMP_BUFFER_SIZE)
+
+    return indexed_bzip2.open(str(filepath), parallelization=decoder_threads(filepath))
+
+
+def scrabble_title_filter(scrabble_words):
+    """
+    Return a predicate for "title.upper() is a Scrabble word".
+    Most dump titles are phrases, non-Latin scripts or too long; since
+    Scrabble words are plain A-Z, those are rejected by length and
+    str.isascii()/isalpha() (no allocation) before upper() and a set probe.
+    """
+    max_len = max(map(len, scrabble_words), default=0)
+
+    def title_filter(title):
+        return (len(title) <= max_len and title.isascii() and title.isalpha()
+                and title.upper() in scrabble_words)
+
+    return title_filter
+
+
+def iter_wiktionary_pages(filepath, title_filter=None):
+    """
+    Iterator that yields (title, text) tuples from Wiktionary XML dump.
+    Streams <page> elements with ElementTree.iterparse and clears each one
+    once yielded, so memory stays flat across the whole dump.
+    If title_filter is given, pages whose title it rejects are dropped
+    before their text is pulled out of the tree.
+    """
+    filepath = Path(filepath)
+
+    print(f"Parsing {filepath}...")
+
+    with open_dump(filepath) as f:
+        page_count = 0
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+
+        for event, elem in context:
+            if event != 'end' or elem.tag.rpartition('}')[2] != 'page':
+                continue
+
+            # Only main namespace pages (skips Wiktionary:, Template:, etc.)
+            if elem.findtext('{*}ns') == '0':
+                page_count += 1
+                if page_count % 50000 == 0:
+                    print(f"  Processed {page_count} pages...")
+
+                title = elem.findtext('{*}title')
+                if title and (title_filter is None or title_filter(title)):
+                    text = elem.findtext('{*}revision/{*}text')
+                    if text:
+                        yield title, text
+
+            # Drop finished pages from the tree
+            root.clear()
+
+    print(f"  Total pages processed: {page_count}")
+
+
+# Set once per worker process by _init_worker (avoids re-sending it per task)
+_worker_scrabble_words = None
+
+
+def _init_worker(scrabble_words):
+    global _worker_scrabble_words
+    _worker_scrabble_words = scrabble_words
+
+
+def worker_scrabble_words():
+    """The Scrabble word set map_page_batches handed to this worker."""
+    return _worker_scrabble_words
+
+
+def iter_page_batches(pages, batch_size=BATCH_SIZE):
+    """Group (title, text) tuples into lists of batch_size pages."""
+    batch = []
+    for page in pages:
+        batch.append(page)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def map_page_batches(func, batches, scrabble_words, max_workers=None):
+    """
+    Run func over page batches in a process pool, yielding results in order.
+    Only a few batches per worker are in flight at once, so the dump is never
+    buffered in memory ahead of the workers.
+    With a single worker there is nothing to overlap with, so func runs
+    in-process instead of paying to pickle every batch.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1:
+        _init_worker(scrabble_words)
+        yield from map(func, batches)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(scrabble_words,)) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(func, batch))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def canonical_etymology(etym_list, interner):
+    """
+    Return the shared, sorted tuple for an etymology list.
+    Identical etymologies resolve to one tuple object through interner,
+    so propagating an etymology aliases it instead of copying a list.
+    """
+    key = tuple(sorted(sys.intern(e) for e in etym_list))
+    return interner.setdefault(key, key)
@@ -5,6 +5,7 @@ Expand etymology dictionary by propagating etymologies to derived terms.
 This script:
 1. Loads the existing etymology.json
 2. Parses Wiktionary to extract "Derived terms" sections
+   (cached in derived_terms.pkl, so reruns on the same dump skip this)
 3. Propagates etymologies from base words to their derived terms
 4. Saves the expanded dictionary
 
@@ -12,23 +13,45 @@ Usage:
     python expand_etymology.py enwiktionary-latest-pages-articles.xml.bz2
 """
 
-import bz2
-import json
+import hashlib
+import pickle
 import re
 import sys
 from collections import defaultdict
 from pathlib import Path
 
-
-def load_scrabble_dictionary(url="https://raw.githubusercontent.com/redbo/scrabble/master/dictionary.txt"):
-    """Load the Scrabble dictionary to filter results."""
-    import urllib.request
-    print(f"Loading Scrabble dictionary from {url}...")
-    with urllib.request.urlopen(url) as response:
-        text = response.read().decode('utf-8')
-    words = set(word.strip().upper() for word in text.split('\n') if word.strip())
-    print(f"Loaded {len(words)} Scrabble words")
-    return words
+from etymology_common import (
+    canonical_etymology,
+    english_section,
+    iter_page_batches,
+    iter_subsections,
+    iter_wiktionary_pages,
+    keep_link_target,
+    load_etymology,
+    load_scrabble_dictionary,
+    map_page_batches,
+    parse_workers,
+    save_compact_etymology,
+    save_etymology,
+    scrabble_title_filter,
+    worker_scrabble_words,
+)
+
+# Derived terms map cache - only depends on the dump and the Scrabble list
+DERIVED_CACHE_PATH = Path(__file__).parent / 'derived_terms.pkl'
+
+# Bump whenever extract_derived_terms changes what it finds, so caches
+# built by an older version are rebuilt instead of reused
+DERIVED_CACHE_VERSION = 3
+
+# Precompiled patterns (these run once per page of the dump)
+_DERIVED_HEADING_RE = re.compile(r'====?Derived terms====?')
+_DERIVED_TMPL_RE = re.compile(r'\{\{(?:col\d*|der\d)\|en\|([^}]+)\}\}')
+# A link only needs its first argument, so it matches even if left unclosed
+_LINK_RE = re.compile(r'\{\{l\|en\|([^|}]+)')
+# One pass over a term: [[term|display]] -> term, drops bold/italic quote
+# runs and any remaining {{templates}}
+_TERM_CLEAN_RE = re.compile(r"\[\[([^\]|]+).*?\]\]|'''?|\{\{[^}]+\}\}")
 
 
 def extract_derived_terms(wiki_text, title):
@@ -37,126 +60,57 @@ def extract_derived_terms(wiki_text, title):
     Returns a list of derived term strings.
     """
     # Only process if it has an English section
-    if '==English==' not in wiki_text:
-        return []
-
-    # Extract the English section
-    english_match = re.search(r'==English==(.*?)(?=\n==[^=]|\Z)', wiki_text, re.DOTALL)
-    if not english_match:
+    section = english_section(wiki_text)
+    if section is None:
         return []
 
-    english_section = english_match.group(1)
-
     # Find "Derived terms" sections (may have multiple)
-    derived_sections = re.findall(
-        r'====?Derived terms====?(.*?)(?=\n===|\n====|\Z)',
-        english_section,
-        re.DOTALL
-    )
+    derived_sections = iter_subsections(section, _DERIVED_HEADING_RE)
 
-    derived_terms = []
+    derived_terms = set()  # Use set to dedupe
 
     for section in derived_sections:
-        # Extract terms from {{col|en|term1|term2|...}} templates
-        col_matches = re.findall(r'\{\{col\d*\|en\|([^}]+)\}\}', section)
-        for match in col_matches:
-            # Split by | and clean up
-            terms = match.split('|')
-            for term in terms:
+        # One scan for {{col|en|term1|term2|...}} and {{der2|en|...}} (der3, der4...)
+        for match in _DERIVED_TMPL_RE.finditer(section):
+            for term in match.group(1).split('|'):
                 term = term.strip()
                 # Skip parameters like title=, sort=, etc.
                 if '=' in term:
                     continue
                 # Clean up the term
-                term = re.sub(r'\[\[([^\]|]+).*?\]\]', r'\1', term)  # [[term|display]] -> term
-                term = re.sub(r"'''?([^']+)'''?", r'\1', term)  # '''term''' -> term
-                term = re.sub(r'\{\{[^}]+\}\}', '', term)  # Remove any remaining templates
-                term = term.strip()
-                if term and term.isalpha():
-                    derived_terms.append(term.upper())
-
-        # Also extract from {{der2|en|...}}, {{der3|en|...}}, {{der4|en|...}}
-        der_matches = re.findall(r'\{\{der\d\|en\|([^}]+)\}\}', section)
-        for match in der_matches:
-            terms = match.split('|')
-            for term in terms:
-                term = term.strip()
-                if '=' in term:
-                    continue
-                term = re.sub(r'\[\[([^\]|]+).*?\]\]', r'\1', term)
-                term = re.sub(r"'''?([^']+)'''?", r'\1', term)
-                term = re.sub(r'\{\{[^}]+\}\}', '', term)
+                term = _TERM_CLEAN_RE.sub(keep_link_target, term)
                 term = term.strip()
                 if term and term.isalpha():
-                    derived_terms.append(term.upper())
+                    derived_terms.add(term.upper())
 
         # Extract simple {{l|en|term}} links
-        l_matches = re.findall(r'\{\{l\|en\|([^|}]+)', section)
-        for term in l_matches:
+        for term in _LINK_RE.findall(section):
             term = term.strip()
             if term and term.isalpha():
-                derived_terms.append(term.upper())
+                derived_terms.add(term.upper())
 
-    return list(set(derived_terms))  # Remove duplicates
+    return list(derived_terms)
 
 
-def iter_wiktionary_pages(filepath):
+def _extract_derived_batch(pages):
     """
-    Iterator that yields (title, text) tuples from Wiktionary XML dump.
+    Worker: extract derived terms for a batch of (already filtered) pages.
+    Returns a list of (WORD, [DERIVED, ...]) tuples, Scrabble words only.
     """
-    filepath = Path(filepath)
+    scrabble_words = worker_scrabble_words()
+    results = []
+    for title, text in pages:
+        word_upper = title.upper()
 
-    if filepath.suffix == '.bz2':
-        open_func = lambda p: bz2.open(p, 'rt', encoding='utf-8')
-    else:
-        open_func = lambda p: open(p, 'r', encoding='utf-8')
-
-    print(f"Parsing {filepath}...")
-
-    with open_func(filepath) as f:
-        current_title = None
-        current_text = []
-        in_text = False
-        page_count = 0
-
-        for line in f:
-            # Look for title
-            title_match = re.search(r'<title>([^<]+)</title>', line)
-            if title_match:
-                current_title = title_match.group(1)
-                continue
-
-            # Look for text start
-            text_start = re.search(r'<text[^>]*>(.*)', line)
-            if text_start:
-                in_text = True
-                content = text_start.group(1)
-                if '</text>' in content:
-                    content = content.split('</text>')[0]
-                    in_text = False
-                    if current_title and ':' not in current_title:
-                        yield current_title, content
-                        page_count += 1
-                        if page_count % 50000 == 0:
-                            print(f"  Processed {page_count} pages...")
-                else:
-                    current_text = [content]
-                continue
-
-            if in_text:
-                if '</text>' in line:
-                    current_text.append(line.split('</text>')[0])
-                    in_text = False
-                    if current_title and ':' not in current_title:
-                        yield current_title, '\n'.join(current_text)
-                        page_count += 1
-                        if page_count % 50000 == 0:
-                            print(f"  Processed {page_count} pages...")
-                    current_text = []
-                else:
-                    current_text.append(line)
-
-    print(f"  Total pages processed: {page_count}")
+        # Extract derived terms
+        derived = extract_derived_terms(text, title)
+
+        # Filter to only Scrabble words
+        derived = [d for d in derived if d in scrabble_words and d != word_upper]
+
+        if derived:
+            results.append((word_upper, derived))
+    return results
 
 
 def build_derived_terms_map(wiktionary_path, scrabble_words):
@@ -167,21 +121,12 @@ def build_derived_terms_map(wiktionary_path, scrabble_words):
     derived_map = defaultdict(set)
     words_with_derived = 0
 
-    for title, text in iter_wiktionary_pages(wiktionary_path):
-        word_upper = title.upper()
-
-        # Only process words in Scrabble dictionary
-        if word_upper not in scrabble_words:
-            continue
-
-        # Extract derived terms
-        derived = extract_derived_terms(text, title)
-
-        # Filter to only Scrabble words
-        derived = [d for d in derived if d in scrabble_words and d != word_upper]
-
-        if derived:
-            derived_map[word_upper].update(derived)
+    # Only parse words in the Scrabble dictionary
+    pages = iter_wiktionary_pages(wiktionary_path, title_filter=scrabble_title_filter(scrabble_words))
+    for results in map_page_batches(_extract_derived_batch, iter_page_batches(pages), scrabble_words,
+                                    max_workers=parse_workers(wiktionary_path)):
+        for word_upper, derived in results:
+            derived_map[sys.intern(word_upper)].update(map(sys.intern, derived))
             words_with_derived += 1
 
             if words_with_derived % 1000 == 0:
@@ -193,23 +138,66 @@ def build_derived_terms_map(wiktionary_path, scrabble_words):
     return derived_map
 
 
+def derived_cache_key(wiktionary_path, scrabble_words):
+    """
+    Identify what a derived terms map was built from: the extraction code
+    (DERIVED_CACHE_VERSION), the dump (by name, size and mtime - cheap, no
+    need to hash gigabytes) and the Scrabble word list.
+    """
+    stat = Path(wiktionary_path).stat()
+    words_digest = hashlib.sha1('\n'.join(sorted(scrabble_words)).encode('utf-8')).hexdigest()
+    return (DERIVED_CACHE_VERSION, Path(wiktionary_path).name, stat.st_size, stat.st_mtime_ns, words_digest)
+
+
+def load_derived_terms_cache(cache_key, cache_path=DERIVED_CACHE_PATH):
+    """
+    Return the cached derived terms map if it matches cache_key, else None.
+    A missing, truncated or otherwise unreadable cache also gives None, so
+    the caller just re-parses the dump.
+    """
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError) as e:
+        print(f"Ignoring unreadable derived terms cache {cache_path}: {e!r}")
+        return None
+    if not isinstance(cached, dict) or cached.get('key') != cache_key:
+        return None
+    derived_map = cached.get('derived_map')
+    return derived_map if isinstance(derived_map, dict) else None
+
+
+def save_derived_terms_cache(derived_map, cache_key, cache_path=DERIVED_CACHE_PATH):
+    """Save a derived terms map so later runs on the same dump skip parsing it."""
+    tmp_path = cache_path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'key': cache_key, 'derived_map': {k: sorted(v) for k, v in derived_map.items()}},
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(cache_path)
+    print(f"Cached derived terms to {cache_path}")
+
+
 def expand_etymology(etymology_dict, derived_map, scrabble_words):
     """
     Expand etymology dictionary by propagating to derived terms.
-    Etymology values are now lists of etymologies.
+    Etymology values are lists of etymologies; the result holds them as
+    shared tuples (see canonical_etymology), which serialize the same.
     """
-    expanded = {k: list(v) for k, v in etymology_dict.items()}  # Deep copy lists
+    interner = {}
+    expanded = {sys.intern(k): canonical_etymology(v, interner) for k, v in etymology_dict.items()}
     propagated = 0
 
     for base_word, derived_terms in derived_map.items():
         # If the base word has etymology
         if base_word in etymology_dict:
-            base_etym = etymology_dict[base_word]
+            base_etym = expanded[base_word]
 
             # Propagate to derived terms that don't have etymology yet
             for derived in derived_terms:
                 if derived not in expanded and derived in scrabble_words:
-                    expanded[derived] = list(base_etym)  # Copy the list
+                    expanded[derived] = base_etym  # Shared tuple, no copy
                     propagated += 1
 
     print(f"Propagated etymology to {propagated} derived terms")
@@ -232,8 +220,7 @@ def main():
     etym_path = Path(__file__).parent / 'etymology.json'
     if etym_path.exists():
         print(f"Loading existing etymology from {etym_path}...")
-        with open(etym_path, 'r', encoding='utf-8') as f:
-            etymology_dict = json.load(f)
+        etymology_dict = load_etymology(etym_path)
         print(f"Loaded {len(etymology_dict)} entries")
     else:
         print("No existing etymology.json found. Run build_etymology.py first.")
@@ -242,9 +229,15 @@ def main():
     # Load Scrabble dictionary
     scrabble_words = load_scrabble_dictionary()
 
-    # Build derived terms map
+    # Build derived terms map (or reuse the one cached for this dump)
     print("\n=== Pass 1: Extracting derived terms ===")
-    derived_map = build_derived_terms_map(wiktionary_path, scrabble_words)
+    cache_key = derived_cache_key(wiktionary_path, scrabble_words)
+    derived_map = load_derived_terms_cache(cache_key)
+    if derived_map is not None:
+        print(f"Using cached derived terms from {DERIVED_CACHE_PATH}")
+    else:
+        derived_map = build_derived_terms_map(wiktionary_path, scrabble_words)
+        save_derived_terms_cache(derived_map, cache_key)
 
     # Expand etymology
     print("\n=== Pass 2: Propagating etymologies ===")
@@ -252,10 +245,14 @@ def main():
 
     # Save expanded dictionary
     output_path = Path(__file__).parent / 'etymology.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(expanded_dict, f, indent=2, sort_keys=True)
+    save_etymology(expanded_dict, output_path)
+
+    # Compact copy the game loads (see save_compact_etymology)
+    compact_path = Path(__file__).parent / 'etymology.compact.json'
+    save_compact_etymology(expanded_dict, compact_path)
 
     print(f"\nSaved expanded etymology dictionary to {output_path}")
+    print(f"Saved game copy to {compact_path}")
     print(f"Original entries: {len(etymology_dict)}")
     print(f"After expansion: {len(expanded_dict)}")
     print(f"New entries added: {len(expanded_dict) - len(etymology_dict)}")
@@ -11,9 +11,18 @@ Usage:
     python expand_inflections.py
 """
 
-import json
+import sys
+from collections import defaultdict, deque
 from pathlib import Path
 
+from etymology_common import (
+    canonical_etymology,
+    load_etymology,
+    load_scrabble_dictionary,
+    save_compact_etymology,
+    save_etymology,
+)
+
 
 # Suffixes to try stripping (order matters - try longer ones first)
 SUFFIXES = [
@@ -35,6 +44,22 @@ SUFFIXES = [
     'Y', 'S', 'D',
 ]
 
+# Extra base endings to try after stripping a suffix, in order
+# (the bare stem, stem + 'E' and an undoubled stem are always tried first)
+SUFFIX_MUTATIONS = {
+    'IES': ('Y',),           # PARTIES -> PARTY
+    'IED': ('Y',),           # PARTIED -> PARTY
+    'IER': ('Y',),           # HAPPIER -> HAPPY
+    'IEST': ('Y',),          # HAPPIEST -> HAPPY
+    'INESS': ('Y',),         # HAPPINESS -> HAPPY
+    'ILY': ('Y',),           # FUNKILY -> FUNKY
+    'IST': ('Y', 'O'),       # COLONIST -> COLONY, LIBRETTIST -> LIBRETTO
+    'ISTS': ('Y', 'O'),      # COLONISTS -> COLONY, LIBRETTISTS -> LIBRETTO
+    'ICALLY': ('IC', 'ICAL'),  # HISTORICALLY -> HISTORIC
+    'OLOGICALLY': ('OLOGY',),  # PHENOLOGICALLY -> PHENOLOGY
+    'IVE': ('ATE',),         # -IVE with -ATE base
+}
+
 # Consonants that commonly double before suffixes
 DOUBLE_CONSONANTS = set('BCDFGKLMNPRSTVZ')
 
@@ -53,163 +78,153 @@ PREFIXES = [
     'UN', 'RE', 'DE', 'BI', 'TRI', 'BE',
 ]
 
+def build_suffix_trie(suffixes):
+    """
+    Build a trie (nested dicts) over the reversed suffixes.
+    A node's '' entry holds the position in suffixes of the suffix ending there,
+    so one walk back from the end of a word finds every suffix it ends with.
+    """
+    trie = {}
+    for i, suffix in enumerate(suffixes):
+        node = trie
+        for ch in reversed(suffix):
+            node = node.setdefault(ch, {})
+        node.setdefault('', i)  # Keep the first position of duplicated suffixes
+    return trie
+
+
+def build_buckets(entries, key):
+    """
+    Group entries into lists by key(entry), keeping their original order.
+    Returns a plain dict, so lookups for a missing key don't add one.
+    """
+    buckets = defaultdict(list)
+    for entry in entries:
+        buckets[key(entry)].append(entry)
+    return dict(buckets)
+
+
+SUFFIX_TRIE = build_suffix_trie(SUFFIXES)
+
+# Latin plurals bucketed by last letter and prefixes by first letter, so a
+# word only tests the entries that could match it (order is preserved)
+LATIN_PLURALS_BY_LAST = build_buckets(LATIN_PLURALS, lambda pair: pair[0][-1])
+PREFIXES_BY_FIRST = build_buckets(PREFIXES, lambda prefix: prefix[0])
+
 
-def load_scrabble_dictionary(url="https://raw.githubusercontent.com/redbo/scrabble/master/dictionary.txt"):
-    """Load the Scrabble dictionary."""
-    import urllib.request
-    print(f"Loading Scrabble dictionary from {url}...")
-    with urllib.request.urlopen(url) as response:
-        text = response.read().decode('utf-8')
-    words = set(word.strip().upper() for word in text.split('\n') if word.strip())
-    print(f"Loaded {len(words)} Scrabble words")
-    return words
+def matching_suffixes(word):
+    """
+    Return the SUFFIXES that word ends with, in SUFFIXES (priority) order.
+    Walks the reversed word down SUFFIX_TRIE once instead of testing
+    word.endswith() against every suffix.
+    """
+    node = SUFFIX_TRIE
+    positions = []
+    for ch in reversed(word):
+        node = node.get(ch)
+        if node is None:
+            break
+        if '' in node:
+            positions.append(node[''])
+    positions.sort()
+    return [SUFFIXES[i] for i in positions]
 
 
-def find_base_word(word, etymology_dict, scrabble_words):
+def candidate_bases(word):
     """
-    Try to find a base word that has etymology.
-    Returns (base_word, etymology) if found, else (None, None).
+    Return every base word that word could be an inflection of, in priority
+    order: Latin plurals, then suffix stripping, then prefix stripping.
+    This depends only on the word, so expand_inflections builds it once per
+    word and every later check is just dictionary lookups.
     """
+    candidates = []
+
     # Try Latin plurals first (special cases)
-    for plural_suffix, singular_suffix in LATIN_PLURALS:
+    for plural_suffix, singular_suffix in LATIN_PLURALS_BY_LAST.get(word[-1], ()):
         if word.endswith(plural_suffix) and len(word) >= len(plural_suffix) + 2:
-            base = word[:-len(plural_suffix)] + singular_suffix
-            if base in etymology_dict:
-                return base, etymology_dict[base]
+            candidates.append(word[:-len(plural_suffix)] + singular_suffix)
 
     # Try removing suffixes
-    for suffix in SUFFIXES:
-        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+    for suffix in matching_suffixes(word):
+        if len(word) > len(suffix) + 2:
             base = word[:-len(suffix)]
 
-            # Direct match
-            if base in etymology_dict:
-                return base, etymology_dict[base]
-
-            # Try adding back 'E' (e.g., MAKING -> MAKE)
-            base_e = base + 'E'
-            if base_e in etymology_dict:
-                return base_e, etymology_dict[base_e]
+            # Direct match, then with 'E' added back (e.g., MAKING -> MAKE)
+            candidates.append(base)
+            candidates.append(base + 'E')
 
             # Try doubling handling (e.g., RUNNING -> RUN, not RUNN)
             # Also handles FROGGING -> FROG (doubled consonant before suffix)
             if len(base) >= 3 and base[-1] == base[-2] and base[-1] in DOUBLE_CONSONANTS:
-                base_undoubled = base[:-1]
-                if base_undoubled in etymology_dict:
-                    return base_undoubled, etymology_dict[base_undoubled]
-
-            # Handle -IES -> -Y (e.g., PARTIES -> PARTY)
-            if suffix == 'IES':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-
-            # Handle -IED -> -Y (e.g., PARTIED -> PARTY)
-            if suffix == 'IED':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-
-            # Handle -IER -> -Y (e.g., HAPPIER -> HAPPY)
-            if suffix == 'IER':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-
-            # Handle -IEST -> -Y (e.g., HAPPIEST -> HAPPY)
-            if suffix == 'IEST':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-
-            # Handle -INESS -> -Y (e.g., HAPPINESS -> HAPPY)
-            if suffix == 'INESS':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-
-            # Handle -ILY -> -Y (e.g., FUNKILY -> FUNKY)
-            if suffix == 'ILY':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-
-            # Handle -IST -> -Y (e.g., COLONIST -> COLONY)
-            if suffix == 'IST':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-                # Also try -O base (Italian: LIBRETTO -> LIBRETTIST)
-                base_o = base + 'O'
-                if base_o in etymology_dict:
-                    return base_o, etymology_dict[base_o]
-
-            # Handle -ISTS -> -Y (e.g., COLONISTS -> COLONY)
-            if suffix == 'ISTS':
-                base_y = base + 'Y'
-                if base_y in etymology_dict:
-                    return base_y, etymology_dict[base_y]
-                # Also try -O base (Italian: LIBRETTO -> LIBRETTISTS)
-                base_o = base + 'O'
-                if base_o in etymology_dict:
-                    return base_o, etymology_dict[base_o]
-
-            # Handle -ICALLY -> -IC (e.g., HISTORICALLY -> HISTORIC)
-            if suffix == 'ICALLY':
-                base_ic = base + 'IC'
-                if base_ic in etymology_dict:
-                    return base_ic, etymology_dict[base_ic]
-                # Also try -ICAL base
-                base_ical = base + 'ICAL'
-                if base_ical in etymology_dict:
-                    return base_ical, etymology_dict[base_ical]
-
-            # Handle -OLOGICAL -> -OLOGY (e.g., PHENOLOGICAL -> PHENOLOGY... but also try PHENOMENON)
-            if suffix == 'OLOGICALLY':
-                base_ology = base + 'OLOGY'
-                if base_ology in etymology_dict:
-                    return base_ology, etymology_dict[base_ology]
-
-            # Handle -IVE with -ATE base (e.g., CREATIVE -> CREATE)
-            if suffix == 'IVE':
-                base_ate = base + 'ATE'
-                if base_ate in etymology_dict:
-                    return base_ate, etymology_dict[base_ate]
-                base_e = base + 'E'
-                if base_e in etymology_dict:
-                    return base_e, etymology_dict[base_e]
+                candidates.append(base[:-1])
+
+            # Suffix-specific base endings (e.g., PARTIES -> PARTY)
+            for ending in SUFFIX_MUTATIONS.get(suffix, ()):
+                candidates.append(base + ending)
 
     # Try removing prefixes
-    for prefix in PREFIXES:
+    for prefix in PREFIXES_BY_FIRST.get(word[0], ()):
         if word.startswith(prefix) and len(word) > len(prefix) + 2:
-            base = word[len(prefix):]
-            if base in etymology_dict:
-                return base, etymology_dict[base]
+            candidates.append(word[len(prefix):])
 
-    return None, None
+    return tuple(candidates)
 
 
 def expand_inflections(etymology_dict, scrabble_words):
     """
     Expand etymology dictionary by finding inflected forms.
     Only fills in blanks - never overwrites.
-    Etymology values are now lists of etymologies.
+    Etymology values are lists of etymologies; the result holds them as
+    shared tuples (see canonical_etymology), which serialize the same.
+
+    Runs as a single worklist pass: when a word gains an etymology, only the
+    words that list it as a candidate base are re-checked, so chains like
+    HAPPY -> HAPPINESS -> HAPPINESSES fill in without rescanning every word.
     """
-    expanded = {k: list(v) for k, v in etymology_dict.items()}  # Deep copy lists
+    interner = {}
+    expanded = {sys.intern(k): canonical_etymology(v, interner) for k, v in etymology_dict.items()}
     propagated = 0
 
     # Find all words without etymology
-    words_without = [w for w in scrabble_words if w not in expanded]
+    words_without = sorted(w for w in scrabble_words if w not in expanded)
     print(f"Words without etymology: {len(words_without)}")
 
-    for i, word in enumerate(words_without):
-        if i > 0 and i % 10000 == 0:
-            print(f"  Checked {i} words, propagated {propagated}...")
-
-        base, etym = find_base_word(word, expanded, scrabble_words)
-        if base and etym:
-            expanded[word] = list(etym)  # Copy the list
-            propagated += 1
+    # Prune each word's candidates once: new entries only ever come from
+    # scrabble_words, so any other candidate not already in the dictionary
+    # can never match. Then build the reverse index: candidate base -> words
+    # waiting on it (bases that are still missing an etymology themselves).
+    candidates = {}
+    waiting = defaultdict(list)
+    for word in words_without:
+        bases = []
+        for base in candidate_bases(word):
+            if base in expanded:
+                bases.append(base)
+            elif base in scrabble_words:
+                bases.append(base)
+                waiting[base].append(word)
+        candidates[word] = bases
+
+    queue = deque(words_without)
+    checked = 0
+
+    while queue:
+        word = queue.popleft()
+        if word in expanded:
+            continue
+
+        checked += 1
+        if checked % 10000 == 0:
+            print(f"  Checked {checked} words, propagated {propagated}...")
+
+        for base in candidates[word]:
+            etym = expanded.get(base)
+            if etym:
+                expanded[word] = etym  # Shared tuple, no copy
+                propagated += 1
+                # Words derived from this one may now resolve too
+                queue.extend(waiting.pop(word, ()))
+                break
 
     print(f"Propagated etymology to {propagated} inflected forms")
     return expanded
@@ -220,8 +235,7 @@ def main():
     etym_path = Path(__file__).parent / 'etymology.json'
     if etym_path.exists():
         print(f"Loading existing etymology from {etym_path}...")
-        with open(etym_path, 'r', encoding='utf-8') as f:
-            etymology_dict = json.load(f)
+        etymology_dict = load_etymology(etym_path)
         print(f"Loaded {len(etymology_dict)} entries")
     else:
         print("No existing etymology.json found.")
@@ -230,33 +244,21 @@ def main():
     # Load Scrabble dictionary
     scrabble_words = load_scrabble_dictionary()
 
-    # Run multiple passes until no new entries are found
+    # Propagate to inflected forms (and inflections of those)
+    print("\n=== Propagating to inflected forms ===")
     original_count = len(etymology_dict)
-    expanded_dict = etymology_dict
-    pass_num = 1
-
-    while True:
-        print(f"\n=== Pass {pass_num}: Propagating to inflected forms ===")
-        before_count = len(expanded_dict)
-        expanded_dict = expand_inflections(expanded_dict, scrabble_words)
-        new_this_pass = len(expanded_dict) - before_count
-        print(f"Pass {pass_num} added {new_this_pass} entries")
-
-        if new_this_pass == 0:
-            print("No new entries found, stopping.")
-            break
-
-        pass_num += 1
-        if pass_num > 10:  # Safety limit
-            print("Reached maximum passes, stopping.")
-            break
+    expanded_dict = expand_inflections(etymology_dict, scrabble_words)
 
     # Save expanded dictionary
     output_path = Path(__file__).parent / 'etymology.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(expanded_dict, f, indent=2, sort_keys=True)
+    save_etymology(expanded_dict, output_path)
+
+    # Compact copy the game loads (see save_compact_etymology)
+    compact_path = Path(__file__).parent / 'etymology.compact.json'
+    save_compact_etymology(expanded_dict, compact_path)
 
     print(f"\nSaved expanded etymology dictionary to {output_path}")
+    print(f"Saved game copy to {compact_path}")
     print(f"Original entries: {original_count}")
     print(f"After expansion: {len(expanded_dict)}")
     print(f"New entries added: {len(expanded_dict) - original_count}")
@@ -3,7 +3,7 @@
 
 // URLs
 export const DICTIONARY_URL = 'https://raw.githubusercontent.com/redbo/scrabble/master/dictionary.txt';
-export const ETYMOLOGY_URL = 'etymology.json';
+export const ETYMOLOGY_URL = 'etymology.compact.json';
 
 // Dictionary state
 let dictionary = new Set();